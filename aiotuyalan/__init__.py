@@ -1,2 +1,19 @@
-from .device import TuyaDevice
-from .light import TuyaLight
+from .lib.lazy import lazy_exports
+
+# Submodules are imported on first attribute access, so tools that only need
+# aiotuyalan.lib.const don't pay for asyncio and the protocol client.
+_EXPORTS = {
+    "TuyaDevice": ".device",
+    "TuyaLight": ".light",
+    "TuyaPoller": ".poller",
+    "TuyaClient": ".lib.client",
+    "TuyaGateway": ".gateway",
+    "TuyaConnectionPool": ".pool",
+    "TuyaScheduler": ".lib.scheduler",
+    "TuyaHistory": ".history",
+    "TuyaScene": ".scene",
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
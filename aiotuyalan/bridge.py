@@ -0,0 +1,374 @@
+import logging
+import asyncio
+import argparse
+import json
+import struct
+
+from typing import Optional, Any, Dict
+
+from .device import TuyaDevice
+from .light import TuyaLight
+
+_LOGGER = logging.getLogger(__name__)
+
+# Every message is a header (body length, message type) followed by the body.
+# Device ids are prefixed with their length, DPS are compact JSON.
+BRIDGE_HEADER = struct.Struct('>IB')
+BRIDGE_ID = struct.Struct('>H')
+BRIDGE_REQUEST = struct.Struct('>I')
+BRIDGE_RESULT = struct.Struct('>IB')
+
+MESSAGE_SUBSCRIBE = 1 # client -> bridge: device ids, none for every device
+MESSAGE_SNAPSHOT = 2 # bridge -> client: device id, full DPS or null while disconnected
+MESSAGE_UPDATE = 3 # bridge -> client: device id, changed DPS
+MESSAGE_COMMAND = 4 # client -> bridge: request id, device id, DPS to set
+MESSAGE_RESULT = 5 # bridge -> client: request id, success flag, error message
+
+# Subscribers that stop reading are dropped instead of buffering without limit
+MAX_SUBSCRIBER_BUFFER = 1024 * 1024
+
+RECONNECT_DELAY = 5
+
+DEVICE_TYPES = {
+    "device": TuyaDevice,
+    "light": TuyaLight
+}
+
+
+def _pack_message(message_type, body) -> bytes:
+    return BRIDGE_HEADER.pack(len(body), message_type) + body
+
+def _pack_id(device_id) -> bytes:
+    raw = device_id.encode('utf-8')
+    return BRIDGE_ID.pack(len(raw)) + raw
+
+def _unpack_id(body, offset):
+    length, = BRIDGE_ID.unpack_from(body, offset)
+    offset += BRIDGE_ID.size
+    return body[offset:offset + length].decode('utf-8'), offset + length
+
+def _pack_dps(dps) -> bytes:
+    return json.dumps(dps, separators=(',', ':')).encode('utf-8')
+
+def _unpack_dps(body, offset):
+    return json.loads(body[offset:].decode('utf-8'))
+
+async def _read_message(reader):
+    length, message_type = BRIDGE_HEADER.unpack(await reader.readexactly(BRIDGE_HEADER.size))
+    return message_type, await reader.readexactly(length)
+
+
+class TuyaBridge:
+
+    def __init__(self, event_loop, path, reconnect_delay=RECONNECT_DELAY):
+        self._event_loop = event_loop
+        self._path = path
+        self._reconnect_delay = reconnect_delay
+        self._server = None
+        self._devices = {}
+        self._snapshots = {}
+        self._subscribers = {}
+        self._tasks = []
+
+    def add_device(self, device) -> None:
+        device_id = device.get_device_info()["cid"] or device.get_device_info()["id"]
+        if device_id in self._devices:
+            raise ValueError("Device {} is already bridged.".format(device_id))
+
+        self._devices[device_id] = device
+        self._snapshots[device_id] = None
+
+        async def _on_update():
+            await self._on_device_update(device_id)
+
+        device.set_on_update(_on_update)
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_unix_server(self._on_client, path=self._path)
+        for device_id in self._devices:
+            self._tasks.append(self._event_loop.create_task(self._maintain_connection(device_id)))
+
+        _LOGGER.info("Bridging %d device(s) on %s", len(self._devices), self._path)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+        for writer in list(self._subscribers):
+            writer.close()
+        self._subscribers = {}
+
+        for device in self._devices.values():
+            if device.is_connected():
+                await device.disconnect()
+
+    async def _maintain_connection(self, device_id) -> None:
+        device = self._devices[device_id]
+        stopped = asyncio.Event()
+
+        async def _on_stop():
+            stopped.set()
+
+        device.set_on_stop(_on_stop)
+
+        while True:
+            stopped.clear()
+            try:
+                await device.connect()
+            except Exception as err:
+                _LOGGER.warning("Unable to connect to %s: %s", device_id, err)
+                await asyncio.sleep(self._reconnect_delay)
+                continue
+
+            await stopped.wait()
+
+            self._snapshots[device_id] = None
+            self._broadcast(device_id, _pack_message(MESSAGE_SNAPSHOT, _pack_id(device_id) + _pack_dps(None)))
+            await asyncio.sleep(self._reconnect_delay)
+
+    async def _on_device_update(self, device_id) -> None:
+        dps = self._devices[device_id].get_dps()
+        snapshot = self._snapshots[device_id]
+        self._snapshots[device_id] = dps
+
+        if snapshot is None:
+            message = _pack_message(MESSAGE_SNAPSHOT, _pack_id(device_id) + _pack_dps(dps))
+        else:
+            changed = {index: value for index, value in dps.items() if snapshot.get(index) != value}
+            if not changed:
+                return
+            message = _pack_message(MESSAGE_UPDATE, _pack_id(device_id) + _pack_dps(changed))
+
+        self._broadcast(device_id, message)
+
+    def _broadcast(self, device_id, message) -> None:
+        for writer, device_ids in list(self._subscribers.items()):
+            if device_ids is None or device_id in device_ids:
+                self._write(writer, message)
+
+    def _write(self, writer, message) -> None:
+        if writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+            _LOGGER.warning("Dropping bridge client that stopped reading.")
+            self._subscribers.pop(writer, None)
+            writer.close()
+            return
+
+        writer.write(message)
+
+    async def _on_client(self, reader, writer) -> None:
+        try:
+            while True:
+                message_type, body = await _read_message(reader)
+
+                if message_type == MESSAGE_SUBSCRIBE:
+                    self._subscribe(writer, body)
+                elif message_type == MESSAGE_COMMAND:
+                    await self._on_command(writer, body)
+                else:
+                    _LOGGER.warning("Unknown bridge message type %d", message_type)
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as err:
+            _LOGGER.error("An error occured while serving a bridge client: %s", err)
+        finally:
+            self._subscribers.pop(writer, None)
+            writer.close()
+
+    def _subscribe(self, writer, body) -> None:
+        device_ids = set()
+        offset = 0
+        while offset < len(body):
+            device_id, offset = _unpack_id(body, offset)
+            device_ids.add(device_id)
+
+        if not device_ids:
+            device_ids = None
+        self._subscribers[writer] = device_ids
+
+        # New clients start from the current state instead of waiting for the next change
+        for device_id, snapshot in self._snapshots.items():
+            if device_ids is None or device_id in device_ids:
+                self._write(writer, _pack_message(MESSAGE_SNAPSHOT, _pack_id(device_id) + _pack_dps(snapshot)))
+
+    async def _on_command(self, writer, body) -> None:
+        request_id, = BRIDGE_REQUEST.unpack_from(body)
+        error = None
+        try:
+            device_id, offset = _unpack_id(body, BRIDGE_REQUEST.size)
+            device = self._devices.get(device_id)
+            if device is None:
+                raise Exception("Unknown device {}".format(device_id))
+            if not device.is_connected():
+                raise Exception("Device {} is not connected.".format(device_id))
+
+            await device.set_dps(_unpack_dps(body, offset))
+        except Exception as err:
+            error = str(err)
+
+        result = BRIDGE_RESULT.pack(request_id, error is None) + (error or '').encode('utf-8')
+        self._write(writer, _pack_message(MESSAGE_RESULT, result))
+
+
+class TuyaBridgeClient:
+
+    def __init__(self, event_loop, path):
+        self._event_loop = event_loop
+        self._path = path
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._snapshots = {}
+        self._requests = {}
+        self._request_id = 0
+        self._on_update_callback = None
+        self._on_stop_callback = None
+
+    def set_on_update(self, on_update):
+        self._on_update_callback = on_update
+
+    def set_on_stop(self, on_stop):
+        self._on_stop_callback = on_stop
+
+    def get_dps(self, device_id) -> Optional[Dict[str, Any]]:
+        dps = self._snapshots.get(device_id)
+        if dps is None:
+            return None
+        return dict(dps)
+
+    def get_device_ids(self):
+        return list(self._snapshots)
+
+    async def connect(self, device_ids=None) -> None:
+        if self._writer is not None:
+            raise Exception("Attempt to connect while already connected!")
+
+        self._reader, self._writer = await asyncio.open_unix_connection(self._path)
+        body = b''.join(_pack_id(device_id) for device_id in device_ids or ())
+        self._writer.write(_pack_message(MESSAGE_SUBSCRIBE, body))
+        self._read_task = self._event_loop.create_task(self._read_loop())
+
+    async def disconnect(self) -> None:
+        if self._writer is None:
+            raise Exception("Attempt to disconnect when not connected!")
+
+        self._read_task.cancel()
+        await self._close()
+
+    async def send_command(self, device_id, dps) -> None:
+        if self._writer is None:
+            raise Exception("Not connected to bridge.")
+
+        self._request_id = (self._request_id + 1) & 0xFFFFFFFF
+        request_id = self._request_id
+        future = self._event_loop.create_future()
+        self._requests[request_id] = future
+
+        body = BRIDGE_REQUEST.pack(request_id) + _pack_id(device_id) + _pack_dps(dps)
+        self._writer.write(_pack_message(MESSAGE_COMMAND, body))
+        try:
+            await future
+        finally:
+            self._requests.pop(request_id, None)
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                message_type, body = await _read_message(self._reader)
+                await self._on_message(message_type, body)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.IncompleteReadError:
+            _LOGGER.info("Bridge at %s closed the connection", self._path)
+        except Exception as err:
+            _LOGGER.error("An error occured while reading from bridge: %s", err)
+
+        await self._close()
+
+    async def _on_message(self, message_type, body) -> None:
+        if message_type == MESSAGE_RESULT:
+            request_id, success = BRIDGE_RESULT.unpack_from(body)
+            future = self._requests.get(request_id)
+            if future is not None and not future.done():
+                if success:
+                    future.set_result(None)
+                else:
+                    future.set_exception(Exception(body[BRIDGE_RESULT.size:].decode('utf-8')))
+            return
+
+        device_id, offset = _unpack_id(body, 0)
+        dps = _unpack_dps(body, offset)
+
+        if message_type == MESSAGE_SNAPSHOT:
+            self._snapshots[device_id] = dps
+        elif message_type == MESSAGE_UPDATE:
+            self._snapshots[device_id] = {**(self._snapshots.get(device_id) or {}), **dps}
+        else:
+            _LOGGER.warning("Unknown bridge message type %d", message_type)
+            return
+
+        if self._on_update_callback:
+            await self._on_update_callback(device_id, dps)
+
+    async def _close(self) -> None:
+        if self._writer is None:
+            return
+
+        self._writer.close()
+        self._writer = None
+        self._reader = None
+        self._read_task = None
+
+        for future in self._requests.values():
+            if not future.done():
+                future.set_exception(Exception("Disconnected from bridge."))
+
+        if self._on_stop_callback is not None:
+            await self._on_stop_callback()
+
+
+def _load_devices(event_loop, path):
+    with open(path, "r") as fh:
+        config = json.load(fh)
+
+    devices = []
+    for entry in config:
+        device_class = DEVICE_TYPES[entry.get("type", "device")]
+        devices.append(device_class(event_loop, entry["address"], entry["id"], entry["local_key"], port=entry.get("port", 6668),
+                                    version=entry.get("version", '3.1'), gw_id=entry.get("gw_id")))
+    return devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Share Tuya device connections with local processes over a Unix socket.")
+    parser.add_argument("config", help="JSON file listing devices (address, id, local_key, and optionally port, version, gw_id, type)")
+    parser.add_argument("--socket", default="/tmp/aiotuyalan.sock", help="Unix socket path to listen on")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    bridge = TuyaBridge(loop, args.socket)
+    for device in _load_devices(loop, args.config):
+        bridge.add_device(device)
+
+    try:
+        loop.run_until_complete(bridge.start())
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(bridge.stop())
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
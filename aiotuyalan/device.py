@@ -1,17 +1,28 @@
 import logging
 import asyncio
+import time
 
-from .lib.client import TuyaClient, COMMAND_DP_QUERY, COMMAND_STATUS, COMMAND_CONTROL
+from typing import Optional, Any, Dict
+
+from .lib.client import TuyaClient
+from .lib.const import COMMAND_DP_QUERY, COMMAND_STATUS, COMMAND_CONTROL
 
 _LOGGER = logging.getLogger(__name__)
 
 class TuyaDevice:
 
+    __slots__ = ('_event_loop', '_connection', '_connector', '_connect_timeout', '_on_stop_callback', '_on_update_callback',
+                 '_device_info', '_local_key', '_dps', '_last_update', '_last_push', '_last_change', '_query_future',
+                 '_query_timeout', '_history')
+
     DPS_INDEX_ON = '1'
 
-    def __init__(self, event_loop, address, id, local_key, port=6668, version='3.1', timeout=30, gw_id=None):
+    CONTROL_ENCRYPTED = False
+
+    def __init__(self, event_loop, address, id, local_key, port=6668, version='3.1', timeout=30, gw_id=None, cid=None, connector=None):
         self._event_loop = event_loop
         self._connection = None
+        self._connector = connector
         self._connect_timeout = timeout
         self._on_stop_callback = None
         self._on_update_callback = None
@@ -20,10 +31,17 @@ class TuyaDevice:
             "port": port,
             "id": id,
             "gw_id": gw_id,
+            "cid": cid,
             "version": version
         }
         self._local_key = local_key
         self._dps = None
+        self._last_update = None
+        self._last_push = None
+        self._last_change = None
+        self._query_future = None
+        self._query_timeout = None
+        self._history = None
 
         if not self._device_info["gw_id"]:
             self._device_info["gw_id"] = id
@@ -51,17 +69,17 @@ class TuyaDevice:
             stopped = True
             self._connection = None
             self._dps = None
+            self._finish_query(exception=Exception("Disconnected from device."))
 
             if connected and self._on_stop_callback is not None:
                 await self._on_stop_callback()
 
             connected = False
 
-
-        async def __on_payload(command, payload):
-            await self._on_payload(command, payload)
-
-        self._connection = TuyaClient(self._device_info, self._local_key, self._event_loop, _on_stop, __on_payload)
+        if self._connector is not None:
+            self._connection = self._connector.create_connection(self._device_info, self._local_key, self._event_loop, _on_stop, self._on_payload)
+        else:
+            self._connection = TuyaClient(self._device_info, self._local_key, self._event_loop, _on_stop, self._on_payload)
 
         try:
             await self._connection.connect()
@@ -85,9 +103,82 @@ class TuyaDevice:
     def set_on_update(self, on_update):
         self._on_update_callback = on_update
 
+    def set_history(self, history):
+        self._history = history
+
+    def get_history(self):
+        return self._history
+
     async def update(self):
+        if self._query_future is not None:
+            return # A query is already in flight, its reply will trigger on_update
+
         await self._connection.send(COMMAND_DP_QUERY, {})
 
+    async def refresh(self, max_age=None) -> Dict[str, Any]:
+        if self._connection is None:
+            raise Exception("Attempt to refresh when not connected!")
+
+        if max_age is not None and self._dps is not None and self._event_loop.time() - self._last_update <= max_age:
+            return dict(self._dps)
+
+        future = self._query_future
+        if future is None:
+            future = self._event_loop.create_future()
+            self._query_future = future
+            self._query_timeout = self._event_loop.call_later(self._connect_timeout, self._expire_query, future)
+
+            try:
+                await self._connection.send(COMMAND_DP_QUERY, {})
+            except Exception as err:
+                self._finish_query(exception=err)
+
+        # Shielded so one caller being cancelled doesn't fail the query for everyone else
+        return dict(await asyncio.shield(future))
+
+    def _expire_query(self, future) -> None:
+        if self._query_future is future:
+            self._finish_query(exception=asyncio.TimeoutError("Timeout while waiting for device state."))
+
+    def _finish_query(self, result=None, exception=None) -> None:
+        future = self._query_future
+        if future is None:
+            return
+
+        self._query_future = None
+        if self._query_timeout is not None:
+            self._query_timeout.cancel()
+            self._query_timeout = None
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def is_connected(self) -> bool:
+        return self._connection is not None
+
+    def get_last_update(self) -> Optional[float]:
+        return self._last_update
+
+    def get_last_push(self) -> Optional[float]:
+        return self._last_push
+
+    def get_last_change(self) -> Optional[float]:
+        return self._last_change
+
+    def get_dps(self) -> Optional[Dict[str, Any]]:
+        if self._dps is None:
+            return None
+        return dict(self._dps)
+
+    async def set_dps(self, dps) -> None:
+        if self._dps is None:
+            raise Exception("Unable to set properties until first update is made to device.")
+        await self._send_control(dps, encrypted=self.CONTROL_ENCRYPTED)
+        self._apply_dps(dps)
+
     def get_enabled(self) -> None:
         if self._dps is None:
             return None
@@ -98,17 +189,66 @@ class TuyaDevice:
         if self._dps is None:
             raise Exception("Unable to set properties until first update is made to device.")
         self._dps[TuyaDevice.DPS_INDEX_ON] = enabled
-        await self._connection.send(COMMAND_CONTROL, {TuyaDevice.DPS_INDEX_ON: enabled})
+        await self._send_control({TuyaDevice.DPS_INDEX_ON: enabled})
+
+    async def _send_control(self, dps, encrypted=False) -> None:
+        self._last_change = self._event_loop.time()
+        await self._connection.send(COMMAND_CONTROL, dps, encrypted=encrypted)
+
+    async def _prepare_control(self, dps, encrypted=False) -> bytes:
+        return await self._connection.prepare(COMMAND_CONTROL, dps, encrypted=encrypted)
+
+    async def _send_prepared_control(self, body) -> None:
+        self._last_change = self._event_loop.time()
+        await self._connection.send_prepared(COMMAND_CONTROL, body)
+
+    def _apply_dps(self, dps) -> None:
+        # Caches DPS the device accepted from a control frame, subclasses also update their parsed state
+        if self._dps is not None:
+            self._dps.update(dps)
+
+    @staticmethod
+    def _get_payload_dps(command, payload) -> Optional[Dict[str, Any]]:
+        # Only query replies and status pushes carry device state, control acks have no payload
+        if command != COMMAND_DP_QUERY and command != COMMAND_STATUS:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        return payload.get('dps')
 
     async def _on_payload(self, command, payload) -> None:
-        if command == COMMAND_DP_QUERY:
-            self._dps = payload['dps'] # Replace entire dps
-        elif command == COMMAND_STATUS:
-            self._dps = {**self._dps, **payload['dps']}
+        dps = TuyaDevice._get_payload_dps(command, payload)
+        if dps is not None:
+            self._update_state(command, dps)
 
+        if self._on_update_callback and self._connection is not None:
+            # The connection decides how callbacks run, low-memory mode takes them off its parser
+            await self._connection.run_callback(self._on_update_callback)
 
-        if self._on_update_callback:
-            await self._on_update_callback()
+    def _update_state(self, command, dps) -> None:
+        previous_dps = self._dps
+        if command == COMMAND_DP_QUERY:
+            self._dps = dict(dps) # Replace entire dps, payloads may be shared between handles
+        else:
+            self._dps = {**self._dps, **dps}
+
+        now = self._event_loop.time()
+        self._last_update = now
+        if command == COMMAND_STATUS:
+            self._last_push = now
+        if self._dps != previous_dps:
+            self._last_change = now
+
+            if self._history is not None:
+                changed = {index: value for index, value in self._dps.items() if previous_dps is None or previous_dps.get(index) != value}
+                try:
+                    self._history.record(time.time(), changed)
+                except Exception as err:
+                    # A full disk or closed journal must not hold up queries and update callbacks
+                    _LOGGER.error("Unable to record history for %s: %s", self._device_info["address"], err)
+
+        if command == COMMAND_DP_QUERY:
+            self._finish_query(result=self._dps)
 
     @staticmethod
     def scale_value(value, mn, mx, new_mn, new_mx):
@@ -0,0 +1,44 @@
+import logging
+
+from .device import TuyaDevice
+from .lib.shared import SharedTuyaClient
+
+_LOGGER = logging.getLogger(__name__)
+
+class TuyaGateway:
+
+    def __init__(self, event_loop, address, id, local_key, port=6668, version='3.3', timeout=30, scheduler=None):
+        self._event_loop = event_loop
+        self._connect_timeout = timeout
+        self._device_info = {
+            "address": address,
+            "port": port,
+            "id": id,
+            "gw_id": id,
+            "cid": None,
+            "version": version
+        }
+        self._local_key = local_key
+
+        if len(local_key) != 16:
+            raise ValueError('Local key length should be 16 characters!')
+
+        # One socket, heartbeat and handshake shared by every sub-device
+        self._shared = SharedTuyaClient(self._device_info, local_key, event_loop, scheduler=scheduler)
+
+    def get_device_info(self):
+        return self._device_info
+
+    def create_device(self, cid, device_class=TuyaDevice):
+        info = self._device_info
+        return device_class(self._event_loop, info["address"], info["id"], self._local_key, port=info["port"],
+                            version=info["version"], timeout=self._connect_timeout, gw_id=info["gw_id"], cid=cid, connector=self)
+
+    def create_connection(self, device_info, local_key, event_loop, on_stop, on_payload):
+        if device_info["cid"] is None:
+            raise ValueError("Gateway connections require a sub-device id (cid).")
+
+        return self._shared.create_handle(on_stop, on_payload, cid=device_info["cid"])
+
+    def get_connected_count(self) -> int:
+        return self._shared.get_handle_count()
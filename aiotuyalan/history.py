@@ -0,0 +1,165 @@
+import logging
+import mmap
+import os
+import struct
+
+from typing import Iterator, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+HISTORY_MAGIC = b'TDPS'
+HISTORY_VERSION = 1
+HISTORY_HEADER = struct.Struct('<4sHH')
+# timestamp (unix seconds), dps index, value
+HISTORY_RECORD = struct.Struct('<dHd')
+MAX_DPS_INDEX = 0xFFFF
+
+# Records are unpacked from the memory map in chunks of this many to bound memory use
+READ_CHUNK_RECORDS = 65536
+
+class TuyaHistory:
+
+    def __init__(self, path):
+        self._path = path
+        self._file = open(path, 'a+b')
+        self._last_timestamp = None
+
+        size = self._file.seek(0, os.SEEK_END)
+        if size == 0:
+            self._file.write(HISTORY_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, HISTORY_RECORD.size))
+            self._file.flush()
+        else:
+            self._file.seek(0)
+            magic, version, record_size = HISTORY_HEADER.unpack(self._file.read(HISTORY_HEADER.size))
+            if magic != HISTORY_MAGIC or version != HISTORY_VERSION or record_size != HISTORY_RECORD.size:
+                self._file.close()
+                raise ValueError("{} is not a compatible DPS history file.".format(path))
+
+            # Drop a partially written record left by a crash so appends stay aligned
+            torn = (size - HISTORY_HEADER.size) % HISTORY_RECORD.size
+            if torn:
+                _LOGGER.warning("Discarding %d bytes of partial record at the end of %s", torn, path)
+                self._file.truncate(size - torn)
+
+            if len(self):
+                self._file.seek(-HISTORY_RECORD.size, os.SEEK_END)
+                self._last_timestamp = HISTORY_RECORD.unpack(self._file.read(HISTORY_RECORD.size))[0]
+
+    def __len__(self) -> int:
+        self._file.flush()
+        return (os.fstat(self._file.fileno()).st_size - HISTORY_HEADER.size) // HISTORY_RECORD.size
+
+    def get_path(self):
+        return self._path
+
+    def record(self, timestamp, dps) -> int:
+        written = 0
+        for index, value in dps.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            try:
+                index = int(index)
+            except ValueError:
+                continue
+            if not 0 <= index <= MAX_DPS_INDEX:
+                continue # Doesn't fit the record format
+            self.record_value(timestamp, index, value)
+            written += 1
+
+        return written
+
+    def record_value(self, timestamp, index, value) -> None:
+        # Queries binary search on time, so keep the file ordered even if the clock steps back
+        if self._last_timestamp is not None and timestamp < self._last_timestamp:
+            timestamp = self._last_timestamp
+        self._last_timestamp = timestamp
+
+        self._file.write(HISTORY_RECORD.pack(timestamp, index, value))
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def query(self, start=None, end=None, index=None) -> Iterator[Tuple[float, str, float]]:
+        if index is not None:
+            index = int(index)
+
+        for chunk in self._read_chunks(start, end):
+            for timestamp, record_index, value in HISTORY_RECORD.iter_unpack(chunk):
+                if index is None or record_index == index:
+                    yield timestamp, str(record_index), value
+
+    def downsample(self, step, start=None, end=None, index=None) -> Iterator[Tuple[float, str, float, float, float, int]]:
+        if step <= 0:
+            raise ValueError("Downsample step must be positive")
+
+        origin = start
+        bucket = None
+        buckets = {}
+
+        for timestamp, record_index, value in self.query(start, end, index):
+            if origin is None:
+                origin = timestamp
+
+            record_bucket = int((timestamp - origin) // step)
+            if record_bucket != bucket:
+                if bucket is not None:
+                    yield from TuyaHistory._flush_buckets(origin + bucket * step, buckets)
+                bucket = record_bucket
+                buckets = {}
+
+            stats = buckets.get(record_index)
+            if stats is None:
+                buckets[record_index] = [value, value, value, 1]
+            else:
+                if value < stats[0]:
+                    stats[0] = value
+                if value > stats[1]:
+                    stats[1] = value
+                stats[2] += value
+                stats[3] += 1
+
+        if bucket is not None:
+            yield from TuyaHistory._flush_buckets(origin + bucket * step, buckets)
+
+    def _read_chunks(self, start, end) -> Iterator[memoryview]:
+        count = len(self)
+        if count == 0:
+            return
+
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+            first = 0 if start is None else self._bisect(records, count, start)
+            last = count if end is None else self._bisect(records, count, end)
+
+            view = memoryview(records)
+            try:
+                for chunk_start in range(first, last, READ_CHUNK_RECORDS):
+                    chunk_end = min(chunk_start + READ_CHUNK_RECORDS, last)
+                    chunk = view[HISTORY_HEADER.size + chunk_start * HISTORY_RECORD.size:HISTORY_HEADER.size + chunk_end * HISTORY_RECORD.size]
+                    try:
+                        yield chunk
+                    finally:
+                        chunk.release()
+            finally:
+                view.release()
+
+    @staticmethod
+    def _bisect(records, count, timestamp) -> int:
+        # Index of the first record at or after timestamp
+        low = 0
+        high = count
+        while low < high:
+            middle = (low + high) // 2
+            if HISTORY_RECORD.unpack_from(records, HISTORY_HEADER.size + middle * HISTORY_RECORD.size)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def _flush_buckets(bucket_start, buckets):
+        for index in sorted(buckets, key=int):
+            mn, mx, total, count = buckets[index]
+            yield bucket_start, index, mn, mx, total / count, count
@@ -1 +1,10 @@
-from .client import TuyaClient
+from .lazy import lazy_exports
+
+_EXPORTS = {
+    "TuyaClient": ".client",
+    "TuyaScheduler": ".scheduler",
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -1,72 +1,90 @@
 import logging
 import asyncio
 import socket
+import struct
 import time
 import json
 import base64
-import bitstring
 import binascii
+import importlib.util
 import traceback
-import pyaes
 
-from typing import Optional, Tuple, List, Any
+from typing import Optional, Tuple, List, Any, Dict
 from hashlib import md5
 
+from .const import *
+
 _LOGGER = logging.getLogger(__name__)
 
-PING_TIME = 10
-
-COMMAND_UDP = 0
-COMMAND_AP_CONFIG = 1
-COMMAND_ACTIVE = 2
-COMMAND_BIND = 3
-COMMAND_RENAME_GW = 4
-COMMAND_RENAME_DEVICE = 5
-COMMAND_UNBIND = 6
-COMMAND_CONTROL = 7
-COMMAND_HEART_BEAT = 9
-COMMAND_STATUS = 8
-COMMAND_DP_QUERY = 10
-COMMAND_QUERY_WIFI = 11
-COMMAND_TOKEN_BIND = 12
-COMMAND_CONTROL_NEW = 13
-COMMAND_ENABLE_WIFI = 14
-COMMAND_DP_QUERY_NEW = 16
-COMMAND_SCENE_EXECUTE = 17
-COMMAND_UDP_NEW = 19
-COMMAND_AP_CONFIG_NEW = 20
-COMMAND_LAN_GW_ACTIVE = 240
-COMMAND_LAN_SUB_DEV_REQUEST = 241
-COMMAND_LAN_DELETE_SUB_DEV = 242
-COMMAND_LAN_REPORT_SUB_DEV = 243
-COMMAND_LAN_SCENE = 244
-COMMAND_LAN_PUBLISH_CLOUD_CONFIG = 245
-COMMAND_LAN_PUBLISH_APP_CONFIG = 246
-COMMAND_LAN_EXPORT_APP_CONFIG = 247
-COMMAND_LAN_PUBLISH_SCENE_PANEL = 248
-COMMAND_LAN_REMOVE_GW = 249
-COMMAND_LAN_CHECK_GW_UPDATE = 250
-COMMAND_LAN_GW_UPDATE = 251
-COMMAND_LAN_SET_GW_CHANNEL = 252
-
-PACKET_PREFIX = b'\x00\x00\x55\xaa'
-PACKET_SUFFIX = b'\x00\x00\xaa\x55'
-
-# Thanks https://stackoverflow.com/questions/45419723/python-timer-with-asyncio-coroutine
-class Timer:
-    def __init__(self, timeout, callback):
-        self._timeout = timeout
-        self._callback = callback
-        self._task = asyncio.ensure_future(self._job())
-
-    async def _job(self):
-        await asyncio.sleep(self._timeout)
-        await self._callback()
-
-    def cancel(self):
-        self._task.cancel()
+FRAME_HEADER = struct.Struct('>IIII') # prefix, sequence number, command, length
+FRAME_FOOTER = struct.Struct('>II') # crc, suffix
+FRAME_RESULT = struct.Struct('>III') # command, length, return code
+FRAME_PREFIX_VALUE = 21930
+FRAME_SUFFIX_VALUE = 43605
+
+# Messages arriving within this many seconds of each other are parsed as one batch
+MESSAGE_BATCH_TIME = 0.1
+
+# Transport writes have no backpressure, a device that stops reading is dropped past this
+MAX_WRITE_BUFFER = 64 * 1024
+
+class _CryptographyBackend:
+    def __init__(self):
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        self._cipher = lambda key: Cipher(algorithms.AES(key), modes.ECB())
+
+    def encrypt(self, key, data) -> bytes:
+        encryptor = self._cipher(key).encryptor()
+        return encryptor.update(TuyaCipher._pad(data)) + encryptor.finalize()
+
+    def decrypt(self, key, data) -> bytes:
+        decryptor = self._cipher(key).decryptor()
+        return TuyaCipher._unpad(decryptor.update(data) + decryptor.finalize())
+
+
+class _PyaesBackend:
+    def __init__(self):
+        import pyaes
+        self._pyaes = pyaes
+
+    def encrypt(self, key, data) -> bytes:
+        cipher = self._pyaes.blockfeeder.Encrypter(self._pyaes.AESModeOfOperationECB(key))
+        return cipher.feed(data) + cipher.feed()
+
+    def decrypt(self, key, data) -> bytes:
+        cipher = self._pyaes.blockfeeder.Decrypter(self._pyaes.AESModeOfOperationECB(key))
+        return cipher.feed(data) + cipher.feed()
+
+
+AES_BACKENDS = {
+    "cryptography": _CryptographyBackend,
+    "pyaes": _PyaesBackend
+}
+
+_aes_backend = None
+
+def load_aes_backend(name=None):
+    # Chosen once on first connection instead of at import. Without a name the C backed cryptography
+    # package is used when it is installed (the "fast" extra), otherwise pyaes.
+    global _aes_backend
+    if name is not None:
+        _aes_backend = AES_BACKENDS[name]()
+    elif _aes_backend is None:
+        if importlib.util.find_spec("cryptography") is not None:
+            try:
+                _aes_backend = _CryptographyBackend()
+            except ImportError as err:
+                _LOGGER.warning("Unable to load cryptography, falling back to pyaes: %s", err)
+        if _aes_backend is None:
+            _aes_backend = _PyaesBackend()
+        _LOGGER.debug("Using %s for AES", type(_aes_backend).__name__)
+    return _aes_backend
+
 
 class TuyaCipher:
+
+    __slots__ = ('_key', '_version', '_bs')
+
     def __init__(self, key, version, bs=16):
         self._key = key.encode('latin1')
         self._version = version
@@ -74,13 +92,7 @@ class TuyaCipher:
 
 
     async def encrypt(self, data, b64=True) -> bytes:
-        #data = self._pad(data)
-        #cipher = AES.new(self._key, AES.MODE_ECB)
-        #encrypted_data = cipher.encrypt(data)
-
-        cipher = pyaes.blockfeeder.Encrypter(pyaes.AESModeOfOperationECB(self._key))
-        encrypted_data = cipher.feed(data)
-        encrypted_data += cipher.feed()
+        encrypted_data = load_aes_backend().encrypt(self._key, data)
 
         if b64:
             return base64.b64encode(encrypted_data)
@@ -94,43 +106,82 @@ class TuyaCipher:
             data = base64.b64decode(data)
             _LOGGER.debug("DECRYPT B64: %s", data.hex())
 
-        cipher = pyaes.blockfeeder.Decrypter(pyaes.AESModeOfOperationECB(self._key))
-        raw = cipher.feed(data)
-        raw += cipher.feed()
-        return raw
-
-        #data = self._pad(data)
-        #log.debug("DECRYPT PAD: %s", data.hex())
-
-        #cipher = AES.new(self._key, AES.MODE_ECB)
-        #raw = cipher.decrypt(data)
-        #raw = self._unpad(raw)
-
-        return raw
+        return load_aes_backend().decrypt(self._key, data)
 
-    def _pad(self, data) -> bytes:
+    @staticmethod
+    def _pad(data) -> bytes:
         length = 16 - (len(data) % 16)
         data += bytes([length])*length
         return data
 
     @staticmethod
     def _unpad(data):
-        return data[:-ord(data[len(data)-1:])]
+        # Same check pyaes makes, so a corrupt frame fails the same way with either backend
+        if not data:
+            raise ValueError('invalid padding byte')
+        length = data[-1]
+        if not 1 <= length <= 16 or length > len(data) or data[-length:] != bytes([length]) * length:
+            raise ValueError('invalid padding byte')
+        return data[:-length]
+
+
+
+class _TuyaProtocol(asyncio.Protocol):
+
+    __slots__ = ('_client', '_buffer')
+
+    def __init__(self, client):
+        self._client = client
+        self._buffer = bytearray()
+
+    def data_received(self, data) -> None:
+        buffer = self._buffer
+        buffer.extend(data)
+
+        while True:
+            start = buffer.find(PACKET_PREFIX)
+            if start < 0: # Keep what could be the start of a split prefix
+                del buffer[:-len(PACKET_PREFIX) + 1]
+                return
+            if start > 0:
+                _LOGGER.warning("Expected packet prefix (%s) received: %s", PACKET_PREFIX.hex(), bytes(buffer[:start]).hex())
+                del buffer[:start]
+
+            if len(buffer) < PACKET_HEADER_LENGTH:
+                return
+
+            message_length = PACKET_HEADER_LENGTH + int.from_bytes(buffer[12:16], "big")
+            if len(buffer) < message_length:
+                return
+
+            self._client._queue_message(bytes(buffer[:message_length]))
+            del buffer[:message_length]
 
+    def connection_lost(self, exc) -> None:
+        self._client._on_connection_lost(exc)
 
 
 class TuyaClient:
-    def __init__(self, device_info, key, event_loop, on_stop, on_payload):
+
+    __slots__ = ('_device_info', '_event_loop', '_on_stop', '_on_payload', '_scheduler', '_stopped', '_socket',
+                 '_socket_reader', '_socket_writer', '_transport', '_write_lock', '_raw_messages', '_flush_handle',
+                 '_authenticated', '_socket_connected', '_sequenceN', '_key', '_cipher')
+
+    def __init__(self, device_info, key, event_loop, on_stop, on_payload, scheduler=None):
         self._device_info = device_info
         self._event_loop = event_loop
         self._on_stop = on_stop
         self._on_payload = on_payload
+        self._scheduler = scheduler
         self._stopped = False
         self._socket = None
         self._socket_reader = None
         self._socket_writer = None
-        self._write_lock = asyncio.Lock()
-        self._seq_lock = asyncio.Lock()
+        self._transport = None
+        # With a shared scheduler, writes go straight to the transport and need no lock
+        self._write_lock = asyncio.Lock() if scheduler is None else None
+        self._raw_messages = []
+        self._flush_handle = None
         self._authenticated = False
         self._socket_connected = False
         self._sequenceN = 0
@@ -138,10 +189,30 @@ class TuyaClient:
         self._cipher = TuyaCipher(key, device_info['version'])
 
 
-    async def send(self, command, dps, encrypted=False) -> None:
+    async def send(self, command, dps, encrypted=False, cid=None) -> None:
+        if not self._socket_connected:
+            raise Exception("Not connected to device.")
+
+        payload = self._build_payload(dps, cid)
+        msg = await self._encode(payload, command, encrypted=encrypted)
+
+        await self._write(msg)
+
+
+    async def prepare(self, command, dps, encrypted=False, cid=None) -> bytes:
+        # Encodes and encrypts a payload once so it can be sent many times with send_prepared()
+        payload = self._build_payload(dps, cid)
+        return await self._encode_payload(payload, command, encrypted=encrypted)
+
+
+    async def send_prepared(self, command, body) -> None:
         if not self._socket_connected:
             raise Exception("Not connected to device.")
 
+        await self._write(self._frame(body, command))
+
+
+    def _build_payload(self, dps, cid) -> Dict[str, Any]:
         payload = {
             "gwId": self._device_info["gw_id"],
             "devId": self._device_info["id"],
@@ -149,10 +220,10 @@ class TuyaClient:
             "dps": dps,
             "uid": self._device_info["id"]
         }
+        if cid is not None:
+            payload["cid"] = cid # Addresses a sub-device behind a gateway
 
-        msg = await self._encode(payload, command, encrypted=encrypted)
-
-        await self._write(msg)
+        return payload
 
 
     async def connect(self) -> None:
@@ -161,6 +232,8 @@ class TuyaClient:
         if self._socket_connected:
             raise Exception("Already connected.")
 
+        load_aes_backend()
+
         try:
             _LOGGER.debug("Resolving ip address...")
             coro = self.resolve_ip_address()
@@ -190,10 +263,27 @@ class TuyaClient:
 
         _LOGGER.debug("Socket opened for {}".format(sockaddr))
 
-        self._socket_reader, self._socket_writer = await asyncio.open_connection(sock=self._socket)
-        self._socket_connected = True
-        self._event_loop.create_task(self._run_loop())
-        self._event_loop.create_task(self._ping_loop())
+        if self._scheduler is not None:
+            self._transport, _ = await self._event_loop.create_connection(lambda: _TuyaProtocol(self), sock=self._socket)
+            self._socket_connected = True
+            self._scheduler.add_client(self)
+        else:
+            self._socket_reader, self._socket_writer = await asyncio.open_connection(sock=self._socket)
+            self._socket_connected = True
+            self._event_loop.create_task(self._run_loop())
+            self._event_loop.create_task(self._ping_loop())
+
+
+    async def run_callback(self, callback) -> None:
+        if self._scheduler is not None:
+            self._scheduler.queue_callback(self, callback)
+        else:
+            await callback()
+
+
+    async def _ping(self) -> None:
+        msg = await self._encode(None, COMMAND_HEART_BEAT)
+        await self._write(msg)
 
 
     async def _ping_loop(self) -> None:
@@ -201,40 +291,18 @@ class TuyaClient:
             while self._socket_connected:
                 await asyncio.sleep(PING_TIME)
                 if self._socket_connected:
-                    msg = await self._encode(None, COMMAND_HEART_BEAT)
-                    await self._write(msg)
+                    await self._ping()
         except Exception as err:
             _LOGGER.error("Unable to send ping to %s: %s", self._device_info['address'], err)
             traceback.print_exc()
 
 
     async def _run_loop(self) -> None:
-        next_msg_timeout = None
-        msg_lock = asyncio.Lock()
-        raw_messages = []
-
-        async def _on_nxt_msg_timeout():
-            nonlocal msg_lock
-            nonlocal raw_messages
-            nonlocal self
-
-            raw_messages_cpy = None
-            async with msg_lock:
-                raw_messages_cpy = raw_messages.copy()
-                raw_messages.clear()
-
-            await self._parse_messages(raw_messages_cpy)
-
         while self._socket_connected:
             try:
                 message = await self._recv()
-                async with msg_lock:
-                    if next_msg_timeout is not None:
-                        next_msg_timeout.cancel()
-
-                    raw_messages.append(message)
-                    next_msg_timeout = Timer(0.1, _on_nxt_msg_timeout)
-                    #_LOGGER.debug("Received raw message: %s", message.hex())
+                self._queue_message(message)
+                #_LOGGER.debug("Received raw message: %s", message.hex())
 
             except Exception as err:
                 _LOGGER.info("Error while reading incoming message from %s: %s", self._device_info["address"], err)
@@ -242,6 +310,34 @@ class TuyaClient:
                 break
 
 
+    def _queue_message(self, message) -> None:
+        if self._stopped:
+            return
+
+        self._raw_messages.append(message)
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = self._event_loop.call_later(MESSAGE_BATCH_TIME, self._flush_messages)
+
+
+    def _flush_messages(self) -> None:
+        self._flush_handle = None
+        messages = self._raw_messages
+        self._raw_messages = []
+
+        if self._scheduler is not None:
+            self._scheduler.queue_messages(self, messages)
+        else:
+            self._event_loop.create_task(self._parse_messages(messages))
+
+
+    def _on_connection_lost(self, exc) -> None:
+        if self._socket_connected:
+            _LOGGER.info("Error while reading incoming message from %s: %s", self._device_info["address"], exc or "Connection closed")
+            self._event_loop.create_task(self._on_error())
+
+
     async def _parse_messages(self, messages) -> None:
         _LOGGER.debug("Processing %d message(s) from device.", len(messages))
         parsed_messages = []
@@ -254,6 +350,9 @@ class TuyaClient:
                 traceback.print_exc()
 
         for command, payload in parsed_messages:
+            if self._stopped:
+                return # The device has already been told the connection is gone
+
             try:
                 if command == COMMAND_HEART_BEAT:
                     _LOGGER.debug("Received pong from %s", self._device_info['address'])
@@ -268,6 +367,8 @@ class TuyaClient:
         try:
             while True: # Find packet prefix to start packet, if not, we're throwing out bytes until we find it...
                 ret = await self._socket_reader.read(4)
+                if not ret:
+                    raise OSError("Connection closed by device")
                 if ret != PACKET_PREFIX:
                     _LOGGER.warning("Expected packet prefix (%s) received: %s", PACKET_PREFIX.hex(), ret.hex())
                 else:
@@ -294,9 +395,16 @@ class TuyaClient:
         #_LOGGER.debug("Wrote: %s", data.hex())
 
         try:
-            async with self._write_lock:
-                self._socket_writer.write(data)
-                await self._socket_writer.drain()
+            if self._transport is not None:
+                if self._transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                    _LOGGER.warning("Closing connection to %s, it stopped reading.", self._device_info["address"])
+                    await self._on_error()
+                    raise Exception("Device stopped reading.")
+                self._transport.write(data)
+            else:
+                async with self._write_lock:
+                    self._socket_writer.write(data)
+                    await self._socket_writer.drain()
         except OSError as err:
             await self._on_error()
             raise Exception("Error while writing data: {}".format(err))
@@ -308,6 +416,11 @@ class TuyaClient:
 
         self._stopped = True
 
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._raw_messages = []
+
         await self._close_socket()
         await self._on_stop()
 
@@ -318,14 +431,19 @@ class TuyaClient:
     async def _close_socket(self) -> None:
         if not self._socket_connected:
             return
-        async with self._write_lock:
-            self._socket_writer.close()
-            self._socket_writer = None
-            self._socket_reader = None
+        if self._transport is not None:
+            self._socket_connected = False
+            self._scheduler.remove_client(self)
+            self._transport.close()
+            self._transport = None
+        else:
+            async with self._write_lock:
+                self._socket_writer.close()
+                self._socket_writer = None
+                self._socket_reader = None
         if self._socket is not None:
             self._socket.close()
         self._socket_connected = False
-        self._connected = False
         _LOGGER.info("Closed socket to TuyaDeivce at %s:%d", self._device_info["address"], self._device_info["port"])
 
 
@@ -344,6 +462,11 @@ class TuyaClient:
 
 
     async def _encode(self, payload, typeByte, encrypted=False) -> bytes:
+        json_payload = await self._encode_payload(payload, typeByte, encrypted=encrypted)
+        return self._frame(json_payload, typeByte)
+
+
+    async def _encode_payload(self, payload, typeByte, encrypted=False) -> bytes:
 
         _LOGGER.debug("Sending Command: %d. Payload %r", typeByte, payload)
 
@@ -379,35 +502,26 @@ class TuyaClient:
 
             #_LOGGER.debug("V3.1 Full Encrypted Payload: %s", json_payload.hex())
 
-        sequenceN = None
-        async with self._seq_lock:
-            sequenceN = self._sequenceN
-            self._sequenceN += 1
+        return json_payload
 
-        stream = bitstring.BitStream()
-        stream.append("uint:32=21930")
-        stream.append("uint:32=" + str(sequenceN))
-        stream.append("uint:32=" + str(typeByte))
-        stream.append("uint:32=" + str(len(json_payload) + 8)) # + 4 (crc) + 4 (suffix)
-        stream.append(json_payload)
 
-        crc_value = binascii.crc32(stream.bytes) & 0xFFFFFFFF
-        stream.append("uint:32=" + str(crc_value))
-        stream.append("uint:32=43605")
+    def _frame(self, json_payload, typeByte) -> bytes:
+        sequenceN = self._sequenceN
+        self._sequenceN += 1
 
-        #_LOGGER.debug("Encoded: %s", stream.bytes.hex())
+        frame = FRAME_HEADER.pack(FRAME_PREFIX_VALUE, sequenceN, typeByte, len(json_payload) + 8) + json_payload # + 4 (crc) + 4 (suffix)
 
-        return stream.bytes
+        crc_value = binascii.crc32(frame) & 0xFFFFFFFF
+        frame += FRAME_FOOTER.pack(crc_value, FRAME_SUFFIX_VALUE)
 
+        #_LOGGER.debug("Encoded: %s", frame.hex())
+
+        return frame
 
-    async def _decode(self, raw_message) -> Tuple[Any, ...]:
-        stream = bitstring.ConstBitStream(raw_message)
-        stream.bytepos = 8
-        command = stream.read('uint:32')
-        payload_length = stream.read('uint:32')
 
-        return_code = stream.read('uint:32')
-        payload_start = stream.bytepos
+    async def _decode(self, raw_message) -> Tuple[Any, ...]:
+        command, payload_length, return_code = FRAME_RESULT.unpack_from(raw_message, 8)
+        payload_start = 8 + FRAME_RESULT.size
 
         if return_code & 0xFFFFFF00:
             payload_length -= 8 # - 4 (tail crc) - 4 (suffix)
@@ -419,39 +533,32 @@ class TuyaClient:
         payload = None
 
         if payload_length > 0:
-            stream.bytepos = payload_end
-            to_crc_length = stream.bytepos
-
-            expected_crc = stream.read('uint:32')
-            suffix = stream.read('bytes:4')
-
-            stream.bytepos = 0
-            actual_crc = binascii.crc32(stream.read('bytes:' + str(to_crc_length))) & 0xFFFFFFFF
+            expected_crc, _ = FRAME_FOOTER.unpack_from(raw_message, payload_end)
+            actual_crc = binascii.crc32(raw_message[:payload_end]) & 0xFFFFFFFF
 
             if actual_crc != expected_crc:
                 _LOGGER.warning("Received message from %s failed CRC32 validation. Throwing out message.. Received %d. Expected %d", self._device_info["address"], actual_crc, expected_crc)
                 return None
 
-            stream.bytepos = payload_start
+            position = payload_start
 
             payload_raw = None
             if self._device_info['version'] == '3.3':
                 if command != COMMAND_DP_QUERY:
-                    stream.bytepos += 15
+                    position += 15
 
-                payload_encrypted = stream.read('bytes:' + str(payload_end - stream.bytepos))
+                payload_encrypted = raw_message[position:payload_end]
                 payload_raw = await self._cipher.decrypt(payload_encrypted, b64=False)
             else: # Old Version
                 version_bytes = self._device_info['version'].encode('utf-8')
-                version_test = stream.read("bytes:" + str(len(version_bytes)))
+                version_test = raw_message[position:position + len(version_bytes)]
 
                 if (version_test == version_bytes): # When the payload is prefixed with the version, the message is encrypted
-                    stream.bytepos += 16 # Remove MD5 hash
-                    payload_encrypted = stream.read('bytes:' + str(payload_end - stream.bytepos))
+                    position += len(version_bytes) + 16 # Remove MD5 hash
+                    payload_encrypted = raw_message[position:payload_end]
                     payload_raw = await self._cipher.decrypt(payload_encrypted, b64=True)
                 else: # Unencrypted message
-                    stream.bytepos -= len(version_bytes)
-                    payload_raw = stream.read('bytes:' + str(payload_end - stream.bytepos))
+                    payload_raw = raw_message[position:payload_end]
 
             if payload_raw is None:
                 raise Exception("Unable to decrypted / read payload.")
@@ -0,0 +1,78 @@
+PING_TIME = 10
+
+COMMAND_UDP = 0
+COMMAND_AP_CONFIG = 1
+COMMAND_ACTIVE = 2
+COMMAND_BIND = 3
+COMMAND_RENAME_GW = 4
+COMMAND_RENAME_DEVICE = 5
+COMMAND_UNBIND = 6
+COMMAND_CONTROL = 7
+COMMAND_HEART_BEAT = 9
+COMMAND_STATUS = 8
+COMMAND_DP_QUERY = 10
+COMMAND_QUERY_WIFI = 11
+COMMAND_TOKEN_BIND = 12
+COMMAND_CONTROL_NEW = 13
+COMMAND_ENABLE_WIFI = 14
+COMMAND_DP_QUERY_NEW = 16
+COMMAND_SCENE_EXECUTE = 17 # Frame body not verified against a device yet, nothing sends it
+COMMAND_UDP_NEW = 19
+COMMAND_AP_CONFIG_NEW = 20
+COMMAND_LAN_GW_ACTIVE = 240
+COMMAND_LAN_SUB_DEV_REQUEST = 241
+COMMAND_LAN_DELETE_SUB_DEV = 242
+COMMAND_LAN_REPORT_SUB_DEV = 243
+COMMAND_LAN_SCENE = 244 # Frame body not verified against a device yet, nothing sends it
+COMMAND_LAN_PUBLISH_CLOUD_CONFIG = 245
+COMMAND_LAN_PUBLISH_APP_CONFIG = 246
+COMMAND_LAN_EXPORT_APP_CONFIG = 247
+COMMAND_LAN_PUBLISH_SCENE_PANEL = 248
+COMMAND_LAN_REMOVE_GW = 249
+COMMAND_LAN_CHECK_GW_UPDATE = 250
+COMMAND_LAN_GW_UPDATE = 251
+COMMAND_LAN_SET_GW_CHANNEL = 252
+
+PACKET_PREFIX = b'\x00\x00\x55\xaa'
+PACKET_SUFFIX = b'\x00\x00\xaa\x55'
+PACKET_HEADER_LENGTH = 16
+
+# Re-exported by lib.client, where these constants lived before
+__all__ = [
+    "PING_TIME",
+    "COMMAND_UDP",
+    "COMMAND_AP_CONFIG",
+    "COMMAND_ACTIVE",
+    "COMMAND_BIND",
+    "COMMAND_RENAME_GW",
+    "COMMAND_RENAME_DEVICE",
+    "COMMAND_UNBIND",
+    "COMMAND_CONTROL",
+    "COMMAND_HEART_BEAT",
+    "COMMAND_STATUS",
+    "COMMAND_DP_QUERY",
+    "COMMAND_QUERY_WIFI",
+    "COMMAND_TOKEN_BIND",
+    "COMMAND_CONTROL_NEW",
+    "COMMAND_ENABLE_WIFI",
+    "COMMAND_DP_QUERY_NEW",
+    "COMMAND_SCENE_EXECUTE",
+    "COMMAND_UDP_NEW",
+    "COMMAND_AP_CONFIG_NEW",
+    "COMMAND_LAN_GW_ACTIVE",
+    "COMMAND_LAN_SUB_DEV_REQUEST",
+    "COMMAND_LAN_DELETE_SUB_DEV",
+    "COMMAND_LAN_REPORT_SUB_DEV",
+    "COMMAND_LAN_SCENE",
+    "COMMAND_LAN_PUBLISH_CLOUD_CONFIG",
+    "COMMAND_LAN_PUBLISH_APP_CONFIG",
+    "COMMAND_LAN_EXPORT_APP_CONFIG",
+    "COMMAND_LAN_PUBLISH_SCENE_PANEL",
+    "COMMAND_LAN_REMOVE_GW",
+    "COMMAND_LAN_CHECK_GW_UPDATE",
+    "COMMAND_LAN_GW_UPDATE",
+    "COMMAND_LAN_SET_GW_CHANNEL",
+    "PACKET_PREFIX",
+    "PACKET_SUFFIX",
+    "PACKET_HEADER_LENGTH",
+]
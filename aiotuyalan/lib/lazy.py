@@ -0,0 +1,19 @@
+import importlib
+import sys
+
+def lazy_exports(name, exports):
+    # Module level __getattr__ and __dir__ (PEP 562) that import a submodule the first time one
+    # of its names is used, so importing a package doesn't pay for everything it exports.
+    def __getattr__(attr):
+        module = exports.get(attr)
+        if module is None:
+            raise AttributeError("module {!r} has no attribute {!r}".format(name, attr))
+
+        value = getattr(importlib.import_module(module, name), attr)
+        setattr(sys.modules[name], attr, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[name])) | set(exports))
+
+    return __getattr__, __dir__
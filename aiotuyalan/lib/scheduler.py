@@ -0,0 +1,121 @@
+import logging
+import asyncio
+import collections
+
+from .client import TuyaClient
+from .const import PING_TIME
+
+_LOGGER = logging.getLogger(__name__)
+
+# Clients are split over this many slots so heartbeats are spread across PING_TIME
+HEARTBEAT_SLOTS = 10
+
+class _WorkQueue:
+
+    __slots__ = ('_scheduler', '_handler', '_items', '_ready', '_task')
+
+    def __init__(self, scheduler, handler):
+        self._scheduler = scheduler
+        self._handler = handler
+        self._items = collections.deque()
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def put(self, client, item) -> None:
+        self._items.append((client, item))
+        self._ready.set()
+
+        if self._task is None:
+            self._task = self._scheduler._event_loop.create_task(self._run_loop())
+
+    def wake(self) -> None:
+        self._ready.set()
+
+    async def _run_loop(self) -> None:
+        # One task works through the items of every client, it lives as long as the scheduler has clients
+        while True:
+            while self._items:
+                client, item = self._items.popleft()
+                try:
+                    await self._handler(client, item)
+                except Exception as err:
+                    _LOGGER.error("An error occured while processing work for %s: %s", client._device_info['address'], err)
+
+            if not self._scheduler._client_slots:
+                self._task = None
+                return
+
+            self._ready.clear()
+            await self._ready.wait()
+
+
+class TuyaScheduler:
+
+    def __init__(self, event_loop, ping_time=PING_TIME):
+        self._event_loop = event_loop
+        self._ping_time = ping_time
+        self._slots = [set() for _ in range(HEARTBEAT_SLOTS)]
+        self._client_slots = {}
+        self._next_slot = 0
+        self._task = None
+        # Parsing and update callbacks run on separate tasks, so a callback waiting on a reply
+        # (refresh() for example) never holds up the parser that has to deliver it
+        self._messages = _WorkQueue(self, TuyaScheduler._parse_messages)
+        self._callbacks = _WorkQueue(self, TuyaScheduler._run_callback)
+
+    def create_connection(self, device_info, local_key, event_loop, on_stop, on_payload):
+        return TuyaClient(device_info, local_key, event_loop, on_stop, on_payload, scheduler=self)
+
+    def get_client_count(self) -> int:
+        return len(self._client_slots)
+
+    def add_client(self, client) -> None:
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % HEARTBEAT_SLOTS
+        self._slots[slot].add(client)
+        self._client_slots[client] = slot
+
+        if self._task is None:
+            self._task = self._event_loop.create_task(self._heartbeat_loop())
+
+    def remove_client(self, client) -> None:
+        slot = self._client_slots.pop(client, None)
+        if slot is not None:
+            self._slots[slot].discard(client)
+
+        if not self._client_slots:
+            # Let the queues drain what's left and exit
+            self._messages.wake()
+            self._callbacks.wake()
+
+    def queue_messages(self, client, messages) -> None:
+        self._messages.put(client, messages)
+
+    def queue_callback(self, client, callback) -> None:
+        self._callbacks.put(client, callback)
+
+    @staticmethod
+    async def _parse_messages(client, messages) -> None:
+        await client._parse_messages(messages)
+
+    @staticmethod
+    async def _run_callback(client, callback) -> None:
+        if not client._stopped:
+            await callback()
+
+    async def _heartbeat_loop(self) -> None:
+        slot = 0
+        while True:
+            await asyncio.sleep(self._ping_time / HEARTBEAT_SLOTS)
+
+            if not self._client_slots:
+                self._task = None
+                return
+
+            for client in list(self._slots[slot]):
+                try:
+                    await client._ping()
+                except Exception as err:
+                    _LOGGER.error("Unable to send ping to %s: %s", client._device_info['address'], err)
+
+            slot = (slot + 1) % HEARTBEAT_SLOTS
@@ -0,0 +1,158 @@
+import logging
+import asyncio
+
+from .client import TuyaClient
+
+_LOGGER = logging.getLogger(__name__)
+
+class TuyaClientHandle:
+
+    __slots__ = ('_shared', '_cid', '_on_stop', '_on_payload', '_stopped')
+    def __init__(self, shared, cid, on_stop, on_payload):
+        self._shared = shared
+        self._cid = cid
+        self._on_stop = on_stop
+        self._on_payload = on_payload
+        self._stopped = False
+
+    def get_cid(self):
+        return self._cid
+
+    async def connect(self) -> None:
+        if self._stopped:
+            raise Exception("Connection is closed.")
+
+        try:
+            await self._shared._acquire(self)
+        except Exception:
+            self._stopped = True
+            self._shared._unref()
+            raise
+
+    async def send(self, command, dps, encrypted=False) -> None:
+        await self._shared.get_client().send(command, dps, encrypted=encrypted, cid=self._cid)
+
+    async def prepare(self, command, dps, encrypted=False) -> bytes:
+        return await self._shared.get_client().prepare(command, dps, encrypted=encrypted, cid=self._cid)
+
+    async def send_prepared(self, command, body) -> None:
+        await self._shared.get_client().send_prepared(command, body)
+
+    async def run_callback(self, callback) -> None:
+        await self._shared.get_client().run_callback(callback)
+
+    async def stop(self) -> None:
+        if self._stopped:
+            return
+
+        self._stopped = True
+
+        await self._shared._release(self)
+        self._shared._unref()
+        await self._on_stop()
+
+    async def _on_shared_stop(self) -> None:
+        if self._stopped:
+            return
+
+        self._stopped = True
+        self._shared._unref()
+        await self._on_stop()
+
+
+class SharedTuyaClient:
+
+    __slots__ = ('_device_info', '_key', '_event_loop', '_on_idle', '_scheduler', '_client', '_handles', '_refs', '_connect_lock')
+
+    def __init__(self, device_info, key, event_loop, on_idle=None, scheduler=None):
+        self._device_info = device_info
+        self._key = key
+        self._event_loop = event_loop
+        self._on_idle = on_idle
+        self._scheduler = scheduler
+        self._client = None
+        self._handles = []
+        self._refs = 0
+        self._connect_lock = asyncio.Lock()
+
+    def create_handle(self, on_stop, on_payload, cid=None) -> TuyaClientHandle:
+        self._refs += 1
+        return TuyaClientHandle(self, cid, on_stop, on_payload)
+
+    def is_compatible(self, device_info, key) -> bool:
+        return key == self._key and device_info["version"] == self._device_info["version"]
+
+    def get_handle_count(self) -> int:
+        return len(self._handles)
+
+    def get_ref_count(self) -> int:
+        return self._refs
+
+    def _unref(self) -> None:
+        self._refs -= 1
+        if self._refs == 0 and self._on_idle is not None:
+            self._on_idle(self)
+
+    async def _acquire(self, handle) -> None:
+        async with self._connect_lock:
+            if self._client is None:
+                client = None
+
+                async def _on_stop():
+                    if self._client is client:
+                        await self._on_client_stop()
+
+                client = TuyaClient(self._device_info, self._key, self._event_loop, _on_stop, self._on_client_payload, scheduler=self._scheduler)
+                self._client = client
+                try:
+                    await client.connect()
+                except Exception:
+                    self._client = None
+                    raise
+
+            self._handles.append(handle)
+
+    async def _release(self, handle) -> None:
+        # Serialised with _acquire so a release can't stop a client another handle is still connecting
+        async with self._connect_lock:
+            if handle in self._handles:
+                self._handles.remove(handle)
+
+            if not self._handles and self._client is not None:
+                client = self._client
+                self._client = None
+                await client.stop()
+
+    def get_client(self) -> TuyaClient:
+        if self._client is None:
+            raise Exception("Not connected to device.")
+
+        return self._client
+
+    async def _on_client_stop(self) -> None:
+        self._client = None
+        handles = self._handles
+        self._handles = []
+
+        for handle in handles:
+            try:
+                await handle._on_shared_stop()
+            except Exception as err:
+                _LOGGER.error("An error occured while stopping a shared connection handle: %s", err)
+
+    async def _on_client_payload(self, command, payload) -> None:
+        cid = None
+        if isinstance(payload, dict):
+            cid = payload.get('cid')
+
+        handles = [handle for handle in self._handles if handle._cid == cid]
+        if not handles:
+            # Gateway-level status has no cid and only reaches a handle opened without one
+            _LOGGER.debug("Dropping command %d from %s with no matching handle (cid %r)", command, self._device_info["address"], cid)
+            return
+
+        for handle in handles:
+            try:
+                await handle._on_payload(command, payload)
+            except Exception as err:
+                _LOGGER.error("An error occured while handling a payload: %s", err)
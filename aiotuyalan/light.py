@@ -1,12 +1,15 @@
 import colorsys
-import bitstring
+import struct
 
 from typing import Optional, Any, Dict, Tuple
 from .device import TuyaDevice
-from .lib.client import COMMAND_CONTROL, COMMAND_DP_QUERY, COMMAND_STATUS
+
+HSV_STRUCT = struct.Struct('>HBB')
 
 class TuyaLight(TuyaDevice):
 
+    __slots__ = ('_mode', '_brightness', '_color_temp', '_color_hue', '_color_saturation')
+
     DPS_INDEX_MODE = '2'
     DPS_INDEX_BRIGHTNESS = '3'
     DPS_INDEX_COLORTEMP = '4'
@@ -25,8 +28,13 @@ class TuyaLight(TuyaDevice):
     DPS_MODE_SCENE_CUSTOM_3 = 'scene_3'
     DPS_MODE_SCENE_CUSTOM_4 = 'scene_4'
 
-    def __init__(self, event_loop, address, id, local_key, port=6668, version='3.1', timeout=30, gw_id=None):
-        super(TuyaLight, self).__init__(event_loop, address, id, local_key, port=port, version=version, timeout=timeout, gw_id=gw_id)
+    CONTROL_ENCRYPTED = True
+
+    SCENE_MODES = (DPS_MODE_SCENE_PRESET, DPS_MODE_SCENE_CUSTOM_1, DPS_MODE_SCENE_CUSTOM_2, DPS_MODE_SCENE_CUSTOM_3,
+                   DPS_MODE_SCENE_CUSTOM_4)
+
+    def __init__(self, event_loop, address, id, local_key, port=6668, version='3.1', timeout=30, gw_id=None, cid=None, connector=None):
+        super(TuyaLight, self).__init__(event_loop, address, id, local_key, port=port, version=version, timeout=timeout, gw_id=gw_id, cid=cid, connector=connector)
 
         self._mode = None
         self._brightness = None
@@ -46,8 +54,8 @@ class TuyaLight(TuyaDevice):
         if 'hs_color' in kwargs:
             update_dps = {**update_dps, **self._get_color_hs_dps(*kwargs['hs_color'])}
             self._mode = TuyaLight.DPS_MODE_COLOR
-            self._hue = kwargs['hs_color'][0]
-            self._saturation = kwargs['hs_color'][1]
+            self._color_hue = kwargs['hs_color'][0]
+            self._color_saturation = kwargs['hs_color'][1]
         if 'brightness' in kwargs:
             update_dps = {**update_dps, **self._get_brightness_dps(kwargs['brightness'])}
             self._brightness = kwargs['brightness']
@@ -55,11 +63,28 @@ class TuyaLight(TuyaDevice):
             update_dps[TuyaDevice.DPS_INDEX_ON] = True
             self._dps[TuyaDevice.DPS_INDEX_ON] = True
 
-        await self._connection.send(COMMAND_CONTROL, update_dps, encrypted=True)
+        await self._send_control(update_dps, encrypted=True)
 
     def get_mode(self) -> Optional[str]:
         return self._mode
 
+    async def set_scene(self, scene, set_on=True) -> None:
+        if self._dps is None:
+            raise Exception("Unable to set properties until first update is made to device.")
+        if scene not in TuyaLight.SCENE_MODES:
+            raise ValueError("Unknown scene mode {}".format(scene))
+
+        # Scenes are stored on the bulb, selecting one only takes the mode DPS
+        update_dps = {TuyaLight.DPS_INDEX_MODE: scene}
+
+        if set_on:
+            update_dps[TuyaDevice.DPS_INDEX_ON] = True
+            self._dps[TuyaDevice.DPS_INDEX_ON] = True
+
+        self._mode = scene
+
+        await self._send_control(update_dps, encrypted=True)
+
     def get_brightness(self) -> Optional[int]:
         return self._brightness
 
@@ -75,7 +100,7 @@ class TuyaLight(TuyaDevice):
 
         self._brightness = brightness
 
-        await self._connection.send(COMMAND_CONTROL, update_dps, encrypted=True)
+        await self._send_control(update_dps, encrypted=True)
 
     def _get_brightness_dps(self, brightness) -> Dict[str, Any]:
 
@@ -111,7 +136,7 @@ class TuyaLight(TuyaDevice):
             update_dps[TuyaDevice.DPS_INDEX_ON] = True
             self._dps[TuyaDevice.DPS_INDEX_ON] = True
 
-        await self._connection.send(COMMAND_CONTROL, update_dps, encrypted=True)
+        await self._send_control(update_dps, encrypted=True)
 
     def _get_color_temp_dps(self, temp) -> Dict[str, Any]:
         if not 0 <= temp <= 255:
@@ -156,7 +181,7 @@ class TuyaLight(TuyaDevice):
         self._color_saturation = saturation
         self._brightness = value
 
-        await self._connection.send(COMMAND_CONTROL, update_dps, encrypted=True)
+        await self._send_control(update_dps, encrypted=True)
 
     def get_color_hs(self) -> Optional[Tuple[int, int]]:
         return (self._color_hue, self._color_saturation)
@@ -172,10 +197,10 @@ class TuyaLight(TuyaDevice):
             self._dps[TuyaDevice.DPS_INDEX_ON] = True
 
         self._mode = TuyaLight.DPS_MODE_COLOR
-        self._hue = hue
-        self._saturation = saturation
+        self._color_hue = hue
+        self._color_saturation = saturation
 
-        await self._connection.send(COMMAND_CONTROL, update_dps, encrypted=True)
+        await self._send_control(update_dps, encrypted=True)
 
     def _get_color_hs_dps(self, hue, saturation) -> Dict[str, Any]:
         if not 0 <= hue <= 360:
@@ -195,49 +220,43 @@ class TuyaLight(TuyaDevice):
 
         return update_dps
 
-    async def _on_payload(self, command, payload) -> None:
+    def _apply_dps(self, dps) -> None:
+        self._parse_dps(dps)
+        super(TuyaLight, self)._apply_dps(dps)
+
+    def _parse_dps(self, dps) -> None:
+        if TuyaLight.DPS_INDEX_MODE in dps:
+            self._mode = dps[TuyaLight.DPS_INDEX_MODE]
 
-        if command == COMMAND_STATUS or command == COMMAND_DP_QUERY:
-            dps = payload['dps']
+        if TuyaLight.DPS_INDEX_BRIGHTNESS in dps and self._mode == TuyaLight.DPS_MODE_WHITE:
+            self._brightness = dps[TuyaLight.DPS_INDEX_BRIGHTNESS]
 
-            if TuyaLight.DPS_INDEX_MODE in dps:
-                self._mode = dps[TuyaLight.DPS_INDEX_MODE]
+        if TuyaLight.DPS_INDEX_COLORTEMP in dps:
+            self._color_temp = dps[TuyaLight.DPS_INDEX_COLORTEMP]
 
-            if TuyaLight.DPS_INDEX_BRIGHTNESS in dps and self._mode == TuyaLight.DPS_MODE_WHITE:
-                self._brightness = dps[TuyaLight.DPS_INDEX_BRIGHTNESS]
+        if TuyaLight.DPS_INDEX_COLOR in dps:
+            hue, saturation, value = TuyaLight._hex_to_hsv(dps[TuyaLight.DPS_INDEX_COLOR])
+            self._color_hue = hue
+            self._color_saturation = saturation
+            if self._mode == TuyaLight.DPS_MODE_COLOR:
+                self._brightness = value
 
-            if TuyaLight.DPS_INDEX_COLORTEMP in dps:
-                self._color_temp = dps[TuyaLight.DPS_INDEX_COLORTEMP]
+    async def _on_payload(self, command, payload) -> None:
 
-            if TuyaLight.DPS_INDEX_COLOR in dps:
-                hue, saturation, value = TuyaLight._hex_to_hsv(dps[TuyaLight.DPS_INDEX_COLOR])
-                self._color_hue = hue
-                self._color_saturation = saturation
-                if self._mode == TuyaLight.DPS_MODE_COLOR:
-                    self._brightness = value
+        dps = TuyaDevice._get_payload_dps(command, payload)
+        if dps is not None:
+            self._parse_dps(dps)
 
         await super(TuyaLight, self)._on_payload(command, payload)
 
     @staticmethod
     def _rgb_to_hex(red, green, blue):
-        stream = bitstring.BitStream()
-        stream.append("uint:8=" + str(red))
-        stream.append("uint:8=" + str(green))
-        stream.append("uint:8=" + str(blue))
-
-        return stream.bytes.hex()
+        return bytes((red, green, blue)).hex()
 
     @staticmethod
     def _hsv_to_hex(hue, saturation, value):
-        stream = bitstring.BitStream()
-        stream.append("uint:16=" + str(hue))
-        stream.append("uint:8=" + str(saturation))
-        stream.append("uint:8=" + str(value))
-
-        return stream.bytes.hex()
+        return HSV_STRUCT.pack(hue, saturation, value).hex()
 
     @staticmethod
     def _hex_to_hsv(hex_str):
-        stream = bitstring.ConstBitStream(hex='0x' + hex_str)
-        stream.bytepos = 3
-        return stream.readlist('uint:16, uint:8, uint:8')
+        return HSV_STRUCT.unpack_from(bytes.fromhex(hex_str), 3)
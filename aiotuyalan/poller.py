@@ -0,0 +1,169 @@
+import logging
+import asyncio
+import heapq
+import random
+
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# Fractional part of the golden ratio. Stepping by it spreads any number of devices
+# evenly over the poll window without knowing the fleet size up front.
+SPREAD_STEP = 0.6180339887498949
+
+class _PollEntry:
+
+    __slots__ = ('device', 'interval', 'last_change', 'removed')
+
+    def __init__(self, device, interval):
+        self.device = device
+        self.interval = interval
+        self.last_change = device.get_last_change()
+        self.removed = False
+
+
+class TuyaPoller:
+
+    def __init__(self, event_loop, min_interval=10, max_interval=300, backoff=2.0, jitter=0.1):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Poll intervals must satisfy 0 < min_interval <= max_interval")
+        if backoff < 1:
+            raise ValueError("Poll backoff must be at least 1")
+        if not 0 <= jitter < 1:
+            raise ValueError("Poll jitter must be between 0 and 1")
+
+        self._event_loop = event_loop
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._jitter = jitter
+        self._entries = {}
+        self._queue = []
+        self._queue_counter = 0
+        self._spread = 0.0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._poll_tasks = set()
+
+    def add_device(self, device) -> None:
+        if device in self._entries:
+            return
+
+        entry = _PollEntry(device, self._min_interval)
+        self._entries[device] = entry
+
+        self._spread = (self._spread + SPREAD_STEP) % 1.0
+        self._schedule(entry, self._event_loop.time() + self._spread * self._min_interval)
+
+    def remove_device(self, device) -> None:
+        entry = self._entries.pop(device, None)
+        if entry is not None:
+            entry.removed = True
+
+    def notify_change(self, device) -> None:
+        entry = self._entries.get(device)
+        if entry is None:
+            return
+
+        # Re-queue at the fast rate, the stale queue slot is skipped when it comes up
+        entry.removed = True
+        entry = _PollEntry(device, self._min_interval)
+        self._entries[device] = entry
+        self._schedule(entry, self._event_loop.time() + self._min_interval)
+
+    def get_interval(self, device) -> Optional[float]:
+        entry = self._entries.get(device)
+        if entry is None:
+            return None
+        return entry.interval
+
+    def start(self) -> None:
+        if self._task is not None:
+            raise Exception("Poller is already running.")
+        self._task = self._event_loop.create_task(self._run_loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        poll_tasks = list(self._poll_tasks)
+        for task in poll_tasks:
+            task.cancel()
+        await asyncio.gather(*poll_tasks, return_exceptions=True)
+
+    def _schedule(self, entry, due) -> None:
+        if self._jitter:
+            due += entry.interval * random.uniform(-self._jitter, self._jitter)
+
+        self._queue_counter += 1
+        heapq.heappush(self._queue, (due, self._queue_counter, entry))
+
+        if self._queue[0][2] is entry:
+            self._wakeup.set()
+
+    async def _run_loop(self) -> None:
+        while True:
+            if not self._queue:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            due, _, entry = self._queue[0]
+            if entry.removed:
+                heapq.heappop(self._queue)
+                continue
+
+            delay = due - self._event_loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            self._poll(entry)
+
+    def _poll(self, entry) -> None:
+        device = entry.device
+        now = self._event_loop.time()
+
+        last_change = device.get_last_change()
+        if last_change != entry.last_change:
+            # State changed or a command was sent since the last poll
+            entry.last_change = last_change
+            entry.interval = self._min_interval
+        else:
+            entry.interval = min(entry.interval * self._backoff, self._max_interval)
+
+        if not device.is_connected():
+            self._schedule(entry, now + entry.interval)
+            return
+
+        last_push = device.get_last_push()
+        if last_push is not None and now - last_push < entry.interval:
+            # Device is pushing status on its own, no need to query it yet
+            self._schedule(entry, last_push + entry.interval)
+            return
+
+        # Each query runs in its own task so a device with a stalled socket only holds up itself
+        task = self._event_loop.create_task(self._update(entry, now))
+        self._poll_tasks.add(task)
+        task.add_done_callback(self._poll_tasks.discard)
+
+    async def _update(self, entry, now) -> None:
+        device = entry.device
+        try:
+            await device.update()
+        except Exception as err:
+            _LOGGER.warning("Unable to poll %s: %s", device.get_device_info()['address'], err)
+
+        self._schedule(entry, now + entry.interval)
@@ -0,0 +1,34 @@
+import logging
+
+from .lib.shared import SharedTuyaClient
+
+_LOGGER = logging.getLogger(__name__)
+
+class TuyaConnectionPool:
+
+    def __init__(self, scheduler=None):
+        self._scheduler = scheduler
+        self._connections = {}
+
+    def create_connection(self, device_info, local_key, event_loop, on_stop, on_payload):
+        key = (device_info["address"], device_info["port"], device_info["id"])
+
+        shared = self._connections.get(key)
+        if shared is None:
+            _LOGGER.debug("Creating pooled connection to %s:%d", device_info["address"], device_info["port"])
+            shared = SharedTuyaClient(device_info, local_key, event_loop, on_idle=lambda shared: self._release(key, shared),
+                                      scheduler=self._scheduler)
+            self._connections[key] = shared
+        elif not shared.is_compatible(device_info, local_key):
+            # The socket and cipher belong to the first handle, a mismatch would silently use its settings
+            raise ValueError("Pooled connection to {}:{} uses a different local key or protocol version.".format(device_info["address"], device_info["port"]))
+
+        return shared.create_handle(on_stop, on_payload, cid=device_info["cid"])
+
+    def get_connection_count(self) -> int:
+        return len(self._connections)
+
+    def _release(self, key, shared) -> None:
+        if self._connections.get(key) is shared:
+            _LOGGER.debug("Releasing pooled connection to %s:%d", key[0], key[1])
+            del self._connections[key]
@@ -0,0 +1,48 @@
+import logging
+import asyncio
+
+_LOGGER = logging.getLogger(__name__)
+
+class TuyaScene:
+
+    def __init__(self):
+        self._actions = []
+        self._compiled = None
+
+    def add(self, device, dps, encrypted=None) -> None:
+        if encrypted is None:
+            encrypted = device.CONTROL_ENCRYPTED # Same framing the device's own set_* methods use
+        self._actions.append((device, dps, encrypted))
+        self._compiled = None
+
+    def get_devices(self):
+        return [device for device, _, _ in self._actions]
+
+    async def compile(self) -> None:
+        # JSON encoding and encryption happen once here, executing only frames and writes the bodies.
+        # The payload timestamp is frozen at compile time, devices don't reject older ones on LAN.
+        compiled = []
+        for device, dps, encrypted in self._actions:
+            if not device.is_connected():
+                raise Exception("Unable to compile scene while {} is not connected.".format(device.get_device_info()['address']))
+            compiled.append((device, dps, await device._prepare_control(dps, encrypted=encrypted)))
+
+        self._compiled = compiled
+
+    async def execute(self) -> None:
+        if self._compiled is None:
+            await self.compile()
+
+        compiled = self._compiled
+        results = await asyncio.gather(*(device._send_prepared_control(body) for device, _, body in compiled), return_exceptions=True)
+
+        errors = []
+        for (device, dps, _), result in zip(compiled, results):
+            if isinstance(result, BaseException):
+                _LOGGER.error("Unable to execute scene action: %s", result)
+                errors.append(result)
+            else:
+                device._apply_dps(dps) # Keep the cached state in line with what set_* methods do
+
+        if errors:
+            raise errors[0]
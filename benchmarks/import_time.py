@@ -0,0 +1,78 @@
+"""Measure import time and time to first command in fresh interpreters.
+
+Import times are the median wall time of running each statement in a new
+Python process, minus the time of an empty one. Time to first command is
+measured from spawning a process that connects a device until the local
+server receives its first frame.
+
+    python benchmarks/import_time.py [runs]
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORTS = (
+    "import aiotuyalan",
+    "from aiotuyalan.lib.const import COMMAND_CONTROL",
+    "from aiotuyalan import TuyaDevice",
+    "from aiotuyalan import TuyaLight",
+)
+
+FIRST_COMMAND = """
+import asyncio, sys
+from aiotuyalan import TuyaDevice
+
+async def main():
+    device = TuyaDevice(asyncio.get_running_loop(), '127.0.0.1', 'device00000', '0123456789abcdef', port=int(sys.argv[1]), version='3.3')
+    await device.connect()
+    await device.disconnect()
+
+asyncio.run(main())
+"""
+
+ENV = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _run(statement) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True, env=ENV)
+    return time.perf_counter() - start
+
+
+async def _first_command() -> float:
+    first_frame = asyncio.get_running_loop().create_future()
+
+    class _Sink(asyncio.Protocol):
+        def data_received(self, data):
+            if not first_frame.done():
+                first_frame.set_result(time.perf_counter())
+
+    server = await asyncio.get_running_loop().create_server(_Sink, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(sys.executable, "-c", FIRST_COMMAND, str(port), env=ENV)
+    received = await first_frame
+    await process.wait()
+    server.close()
+
+    return received - start
+
+
+def main(runs):
+    baseline = statistics.median(_run("pass") for _ in range(runs))
+
+    print("{:>52} {:>10}".format("", "median ms"))
+    for statement in IMPORTS:
+        timing = statistics.median(_run(statement) for _ in range(runs)) - baseline
+        print("{:>52} {:>10.1f}".format(statement, timing * 1000))
+
+    timing = statistics.median(asyncio.run(_first_command()) for _ in range(runs))
+    print("{:>52} {:>10.1f}".format("time to first command (incl. interpreter)", timing * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,165 @@
+"""Measure memory and task count per connected device.
+
+Starts a server in a child process that accepts any number of connections,
+answers each with a status reply and then keeps pushing status updates, and
+connects simulated devices to it with the default TuyaClient and with a shared
+TuyaScheduler (low-memory mode). Tasks are counted while the pushes arrive,
+both the peak alive at once and how many were created per received push.
+
+    python benchmarks/memory.py [device counts...]
+"""
+import asyncio
+import binascii
+import gc
+import json
+import multiprocessing
+import os
+import resource
+import struct
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiotuyalan.lib.client
+
+from aiotuyalan import TuyaDevice, TuyaScheduler
+
+LOCAL_KEY = '0123456789abcdef'
+CONNECT_BATCH = 500
+
+# Keep heartbeats out of the measurement window, at 10k devices they would saturate the loop
+# and slow connecting down without changing what is held per device.
+BENCHMARK_PING_TIME = 3600
+
+# Every connection gets a status push this often, the way metering plugs report power
+PUSH_INTERVAL = 1.0
+PUSH_WINDOW = 3.0
+
+COMMAND_DP_QUERY = 10
+COMMAND_STATUS = 8
+
+
+def _status_frame(command, dps):
+    payload = json.dumps({"dps": dps}).encode('utf-8')
+    frame = struct.pack('>IIIII', 0x55AA, 0, command, len(payload) + 12, 0) + payload
+    return frame + struct.pack('>II', binascii.crc32(frame) & 0xFFFFFFFF, 0xAA55)
+
+
+class _Pusher(asyncio.Protocol):
+    def connection_made(self, transport):
+        self._transport = transport
+        self._value = 0
+        transport.write(_status_frame(COMMAND_DP_QUERY, {'1': True, '19': 0}))
+        loop = asyncio.get_running_loop()
+        # Spread pushes over the interval instead of sending them in lockstep
+        self._handle = loop.call_later(PUSH_INTERVAL * (id(self) % 997) / 997, self._push)
+
+    def _push(self):
+        self._value += 1
+        self._transport.write(_status_frame(COMMAND_STATUS, {'19': self._value}))
+        self._handle = asyncio.get_running_loop().call_later(PUSH_INTERVAL, self._push)
+
+    def data_received(self, data):
+        pass
+
+    def connection_lost(self, exc):
+        self._handle.cancel()
+
+
+def _serve(port_queue):
+    async def main():
+        server = await asyncio.get_running_loop().create_server(_Pusher, '127.0.0.1', 0, backlog=4096)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    _raise_fd_limit()
+    asyncio.run(main())
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def _measure(port, count, low_memory):
+    loop = asyncio.get_running_loop()
+    aiotuyalan.lib.client.PING_TIME = BENCHMARK_PING_TIME
+    connector = TuyaScheduler(loop, ping_time=BENCHMARK_PING_TIME) if low_memory else None
+
+    await asyncio.sleep(0.2)
+    gc.collect()
+    tasks_before = len(asyncio.all_tasks())
+    memory_before = tracemalloc.get_traced_memory()[0]
+
+    devices = [TuyaDevice(loop, '127.0.0.1', 'device{:05d}'.format(i), LOCAL_KEY, port=port, version='3.1', connector=connector)
+               for i in range(count)]
+    for start in range(0, count, CONNECT_BATCH):
+        await asyncio.gather(*(device.connect() for device in devices[start:start + CONNECT_BATCH]))
+
+    await asyncio.sleep(0.5) # Let connection setup and the first query settle
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0] - memory_before
+
+    pushes = 0
+    async def _on_update():
+        nonlocal pushes
+        pushes += 1
+    for device in devices:
+        device.set_on_update(_on_update)
+
+    created = 0
+    default_factory = loop.get_task_factory()
+    def _counting_factory(loop, coro, **kwargs):
+        nonlocal created
+        created += 1
+        if default_factory is not None:
+            return default_factory(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+    loop.set_task_factory(_counting_factory)
+
+    peak_tasks = 0
+    end = loop.time() + PUSH_WINDOW
+    while loop.time() < end:
+        peak_tasks = max(peak_tasks, len(asyncio.all_tasks()) - tasks_before - 1) # - this sampling loop
+        await asyncio.sleep(0.01)
+
+    loop.set_task_factory(default_factory)
+    pushes_seen = pushes
+
+    for start in range(0, count, CONNECT_BATCH):
+        await asyncio.gather(*(device.disconnect() for device in devices[start:start + CONNECT_BATCH]))
+
+    return memory / count, peak_tasks / count, created / max(pushes_seen, 1)
+
+
+def _run(port, count, low_memory, result_queue):
+    # Each measurement gets a fresh process so leftovers from a previous run don't skew it
+    _raise_fd_limit()
+    tracemalloc.start()
+    result_queue.put(asyncio.run(_measure(port, count, low_memory)))
+
+
+def main(counts, port):
+    print("{:>8} {:>12} {:>16} {:>16} {:>16}".format("devices", "mode", "bytes/device", "tasks/device", "new tasks/push"))
+    for count in counts:
+        for low_memory in (False, True):
+            result_queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_run, args=(port, count, low_memory, result_queue))
+            process.start()
+            memory, tasks, created = result_queue.get()
+            process.join()
+            print("{:>8} {:>12} {:>16.0f} {:>16.2f} {:>16.2f}".format(count, "low-memory" if low_memory else "default", memory, tasks, created))
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+
+    _raise_fd_limit()
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(port_queue,), daemon=True)
+    server.start()
+    try:
+        main(counts, port_queue.get())
+    finally:
+        server.terminate()
@@ -0,0 +1,96 @@
+"""Compare end-to-end scene latency against sending per-device commands.
+
+Connects simulated devices to a local server that counts the control frames it
+receives, then times how long it takes until every device got its frame when
+commands are sent one after another, concurrently, and through a TuyaScene.
+
+    python benchmarks/scene_latency.py [device count] [rounds]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiotuyalan import TuyaDevice, TuyaScene
+from aiotuyalan.lib.const import PACKET_SUFFIX
+
+LOCAL_KEY = '0123456789abcdef'
+SCENE_DPS = {'1': True, '2': 'white', '3': 255, '4': 128}
+
+
+class _FrameCounter(asyncio.Protocol):
+    def __init__(self, counter):
+        self._counter = counter
+
+    def data_received(self, data):
+        self._counter.add(data.count(PACKET_SUFFIX))
+
+
+class _Counter:
+    def __init__(self):
+        self.count = 0
+        self.target = None
+        self.done = None
+
+    def expect(self, frames):
+        self.target = self.count + frames
+        self.done = asyncio.get_running_loop().create_future()
+
+    def add(self, frames):
+        self.count += frames
+        if self.done is not None and not self.done.done() and self.count >= self.target:
+            self.done.set_result(None)
+
+
+async def _time(counter, devices, run):
+    counter.expect(len(devices))
+    start = time.perf_counter()
+    await run()
+    await counter.done
+    return time.perf_counter() - start
+
+
+async def main(count, rounds):
+    loop = asyncio.get_running_loop()
+    counter = _Counter()
+    server = await loop.create_server(lambda: _FrameCounter(counter), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    devices = [TuyaDevice(loop, '127.0.0.1', 'device{:05d}'.format(i), LOCAL_KEY, port=port, version='3.3') for i in range(count)]
+    for device in devices:
+        await device.connect()
+    await asyncio.sleep(0.5)
+
+    scene = TuyaScene()
+    for device in devices:
+        scene.add(device, SCENE_DPS)
+    await scene.compile()
+
+    # _send_control is the path every set_* method takes
+    async def sequential():
+        for device in devices:
+            await device._send_control(SCENE_DPS)
+
+    async def concurrent():
+        await asyncio.gather(*(device._send_control(SCENE_DPS) for device in devices))
+
+    results = {}
+    for name, run in (("sequential", sequential), ("concurrent", concurrent), ("scene", scene.execute)):
+        results[name] = [await _time(counter, devices, run) for _ in range(rounds)]
+
+    print("{:>12} {:>12} {:>12}".format("approach", "median ms", "min ms"))
+    for name, timings in results.items():
+        print("{:>12} {:>12.2f} {:>12.2f}".format(name, statistics.median(timings) * 1000, min(timings) * 1000))
+
+    for device in devices:
+        await device.disconnect()
+    server.close()
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(count, rounds))
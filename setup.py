@@ -22,5 +22,13 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=requires,
-    python_requires='>=3.5.3'
+    extras_require={
+        "fast": ["cryptography"]
+    },
+    entry_points={
+        "console_scripts": [
+            "aiotuyalan-bridge=aiotuyalan.bridge:main"
+        ]
+    },
+    python_requires='>=3.7'
 )